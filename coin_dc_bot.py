@@ -3,7 +3,7 @@
 CoinDCX Trading Telegram Bot (single-file)
 - Uses environment variables for credentials.
 - Commands: /buy /sell /profit /status /stop /stopall
-- Requires: python-telegram-bot==13.14, requests
+- Requires: python-telegram-bot>=20, aiohttp
 """
 from __future__ import annotations
 
@@ -13,22 +13,43 @@ import time
 import hmac
 import hashlib
 import logging
+import functools
+import asyncio
 import threading
+from collections import defaultdict
 from typing import Optional, Dict, Any
-import requests
+import aiohttp
+import numpy as np
 
-from telegram import Update, ParseMode
+from telegram import Update
+from telegram.constants import ParseMode
 from telegram.ext import (
-    Updater,
+    Application,
     CommandHandler,
-    MessageHandler,
-    Filters,
+    ContextTypes,
     ConversationHandler,
-    CallbackContext,
+    MessageHandler,
+    filters,
 )
 from dotenv import load_dotenv
 load_dotenv()
 
+# orjson is ~5-10x faster than stdlib json on orderbook-sized payloads; its
+# compact UTF-8 output is byte-identical to json.dumps(separators=(",", ":"),
+# ensure_ascii=False) for our payloads, so signatures are unaffected.
+try:
+    import orjson
+
+    def _json_dumps_bytes(body: dict) -> bytes:
+        return orjson.dumps(body)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps_bytes(body: dict) -> bytes:
+        return json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode()
+
+    _json_loads = json.loads
+
 # Config from env
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 API_KEY = os.getenv("COINDCX_API_KEY")
@@ -45,47 +66,110 @@ PUBLIC_ORDERBOOK = "https://public.coindcx.com/market_data/orderbook?pair=B-{coi
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("coin_dc_bot")
 
-# session store
-user_sessions: Dict[int, Dict[str, Any]] = {}
-session_lock = threading.Lock()
+# Shared aiohttp session: keep-alive + pooled connections instead of a fresh
+# TCP/TLS handshake per call (the continuous-edit loop is network-bound).
+# Created lazily so it binds to the application's event loop.
+_aio_session: Optional[aiohttp.ClientSession] = None
+
+async def _get_aio_session() -> aiohttp.ClientSession:
+    global _aio_session
+    if _aio_session is None or _aio_session.closed:
+        _aio_session = aiohttp.ClientSession(headers={
+            "X-AUTH-APIKEY": API_KEY,
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+    return _aio_session
+
+# session store, sharded per user: workers and handlers only contend on the
+# lock of the user whose sessions they touch, never on a global one.
+user_sessions: Dict[int, Dict[str, Any]] = defaultdict(dict)
+_user_locks: Dict[int, threading.Lock] = {}
+_locks_guard = threading.Lock()  # lazy _user_locks creation + session counter
 SESSION_COUNTER = 0
 
+# Hard cap on concurrent continuous sessions: tasks are cheap but every
+# active session is live order traffic, so saturation rejects new ones.
+MAX_SESSIONS = 64
+_ACTIVE_SESSIONS = 0
+
+def _try_reserve_session_slot() -> bool:
+    global _ACTIVE_SESSIONS
+    with _locks_guard:
+        if _ACTIVE_SESSIONS >= MAX_SESSIONS:
+            return False
+        _ACTIVE_SESSIONS += 1
+        return True
+
+def _release_session_slot():
+    global _ACTIVE_SESSIONS
+    with _locks_guard:
+        _ACTIVE_SESSIONS -= 1
+
+def _user_lock(user_id: int) -> threading.Lock:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        with _locks_guard:
+            lock = _user_locks.setdefault(user_id, threading.Lock())
+    return lock
+
 # Conversation states
 (BUY_COIN, BUY_PRICE, BUY_INVESTMENT, BUY_PRECISION, BUY_MODE) = range(5)
 (SELL_COIN, SELL_PRICE, SELL_INVESTMENT, SELL_PRECISION, SELL_MODE) = range(5, 10)
 PROFIT_COIN = 10
 
+# HMAC key setup (inner/outer pad schedule) is the dominant per-call cost for
+# short payloads; pay it once at import and .copy() the template per signature.
+# cryptography's HMAC goes straight to OpenSSL EVP (SHA-NI/ARMv8-accelerated)
+# without the stdlib hmac module's Python-level dispatch; fall back to the
+# stdlib template when cryptography isn't installed.
+try:
+    from cryptography.hazmat.primitives import hashes as _c_hashes
+    from cryptography.hazmat.primitives import hmac as _c_hmac
+
+    _HMAC_TEMPLATE = _c_hmac.HMAC(SECRET_BYTES, _c_hashes.SHA256())
+
+    def _sign_bytes(payload_bytes: bytes) -> str:
+        h = _HMAC_TEMPLATE.copy()
+        h.update(payload_bytes)
+        return h.finalize().hex()
+except ImportError:
+    _HMAC_TEMPLATE = hmac.new(SECRET_BYTES, digestmod=hashlib.sha256)
+
+    def _sign_bytes(payload_bytes: bytes) -> str:
+        h = _HMAC_TEMPLATE.copy()
+        h.update(payload_bytes)
+        return h.hexdigest()
+
 def sign_payload(body: dict) -> str:
-    payload = json.dumps(body, separators=(",", ":"), ensure_ascii=False)
-    signature = hmac.new(SECRET_BYTES, payload.encode(), hashlib.sha256).hexdigest()
-    return signature
+    return _sign_bytes(_json_dumps_bytes(body))
 
-def post_signed(path: str, body: dict, timeout: float = 10.0) -> Optional[dict]:
+async def apost_signed(path: str, body: dict, timeout: float = 10.0) -> Optional[dict]:
+    return await _apost_signed_bytes(path, _json_dumps_bytes(body), timeout)
+
+async def _apost_signed_bytes(path: str, payload: bytes, timeout: float = 10.0) -> Optional[dict]:
     url = API_BASE + path
-    payload = json.dumps(body, separators=(",", ":"), ensure_ascii=False)
-    signature = hmac.new(SECRET_BYTES, payload.encode(), hashlib.sha256).hexdigest()
-    headers = {
-        "Content-Type": "application/json",
-        "X-AUTH-APIKEY": API_KEY,
-        "X-AUTH-SIGNATURE": signature,
-    }
+    headers = {"X-AUTH-SIGNATURE": _sign_bytes(payload)}
     try:
-        resp = requests.post(url, data=payload, headers=headers, timeout=timeout)
-        resp.raise_for_status()
-        return resp.json()
-    except requests.RequestException as e:
+        sess = await _get_aio_session()
+        async with sess.post(url, data=payload, headers=headers,
+                             timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            return _json_loads(await resp.read())
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.warning("POST %s failed: %s", url, e)
         return None
     except ValueError:
         logger.warning("POST %s returned non-JSON", url)
         return None
 
-def get_public_orderbook(coin: str, timeout: float = 8.0) -> Optional[dict]:
+async def aget_public_orderbook(coin: str, timeout: float = 8.0) -> Optional[dict]:
     url = PUBLIC_ORDERBOOK.format(coin=coin.upper())
     try:
-        r = requests.get(url, timeout=timeout)
-        r.raise_for_status()
-        return r.json()
+        sess = await _get_aio_session()
+        async with sess.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            r.raise_for_status()
+            return _json_loads(await r.read())
     except Exception as e:
         logger.warning("Orderbook fetch failed for %s: %s", coin, e)
         return None
@@ -95,39 +179,186 @@ def round_price(price: float, precision: int) -> float:
 
 def next_session_id() -> int:
     global SESSION_COUNTER
-    with session_lock:
+    with _locks_guard:
         SESSION_COUNTER += 1
         return SESSION_COUNTER
 
 # API primitives
-def create_limit_order(side: str, coin: str, price: float, quantity: float) -> Optional[dict]:
-    timestamp = int(round(time.time() * 1000))
-    body = {
-        "side": side,
-        "market": f"{coin}INR",
-        "timestamp": timestamp,
-        "price_per_unit": price,
-        "total_quantity": quantity,
-        "order_type": "limit",
-    }
-    return post_signed("/exchange/v1/orders/create", body)
-
-def edit_order(order_id: str, price: float) -> Optional[dict]:
-    timestamp = int(round(time.time() * 1000))
-    body = {"id": str(order_id), "timestamp": timestamp, "price_per_unit": price}
-    return post_signed("/exchange/v1/orders/edit", body)
-
-def cancel_order(order_id: str) -> Optional[dict]:
-    timestamp = int(round(time.time() * 1000))
-    body = {"id": str(order_id), "timestamp": timestamp}
-    return post_signed("/exchange/v1/orders/cancel", body)
-
-# Background worker
-def start_continuous_edit(user_id: int, session_id: int, session_obj: dict):
-    logger.info("Starting session %s for user %s", session_id, user_id)
+@functools.lru_cache(maxsize=256)
+def _create_payload_builder(coin: str, side: str):
+    """Specialized order-create payload builder for a fixed (coin, side).
+
+    Partial evaluation: the constant fields are baked into the template once,
+    so repeat calls for the same market (the continuous-session case) only
+    interpolate timestamp, price and quantity."""
+    prefix = f'{{"side":"{side}","market":"{coin}INR","timestamp":'
+    def build(price: float, quantity: float) -> bytes:
+        timestamp = time.time_ns() // 1_000_000
+        return (f'{prefix}{timestamp},"price_per_unit":{price!r},'
+                f'"total_quantity":{quantity!r},"order_type":"limit"}}').encode()
+    return build
+
+async def acreate_limit_order(side: str, coin: str, price: float, quantity: float) -> Optional[dict]:
+    payload = _create_payload_builder(coin, side)(price, quantity)
+    return await _apost_signed_bytes("/exchange/v1/orders/create", payload)
+
+# edit/cancel have a fixed tiny schema, so the payload is templated straight
+# to bytes (no dict build, no serializer call). !r keeps full float precision.
+async def aedit_order(order_id: str, price: float) -> Optional[dict]:
+    timestamp = time.time_ns() // 1_000_000
+    payload = f'{{"id":"{order_id}","timestamp":{timestamp},"price_per_unit":{price!r}}}'.encode()
+    return await _apost_signed_bytes("/exchange/v1/orders/edit", payload)
+
+async def acancel_order(order_id: str) -> Optional[dict]:
+    timestamp = time.time_ns() // 1_000_000
+    payload = f'{{"id":"{order_id}","timestamp":{timestamp}}}'.encode()
+    return await _apost_signed_bytes("/exchange/v1/orders/cancel", payload)
+
+_EMPTY_F64 = np.empty(0, dtype=np.float64)
+
+# Capacity of the per-session SoA snapshot buffers; books deeper than this
+# are truncated (the loop only ever acts near the top of the book).
+SOA_CAPACITY = 512
+
+# The candidate sits in the top handful of levels in practice, so the session
+# loop only parses/scans this many (the API returns hundreds). 32 is generous.
+TOP_LEVELS = 32
+
+def side_arrays(side, out_prices: Optional[np.ndarray] = None,
+                out_qtys: Optional[np.ndarray] = None) -> tuple:
+    """Normalize an orderbook side (dict of price->qty, or list of [price, qty]
+    pairs) into parallel float64 price/qty arrays. Malformed sides come back
+    as empty arrays.
+
+    With preallocated ``out_prices``/``out_qtys`` buffers the entries are
+    written in place (SoA layout, capped at buffer capacity) and sliced views
+    are returned, so steady-state refills allocate nothing."""
+    if out_prices is not None and out_qtys is not None:
+        cap = out_prices.shape[0]
+        i = 0
+        try:
+            items = side.items() if isinstance(side, dict) else side
+            for entry in items:
+                if i >= cap:
+                    break
+                out_prices[i] = float(entry[0])
+                out_qtys[i] = float(entry[1])
+                i += 1
+        except (TypeError, ValueError, IndexError, KeyError):
+            return _EMPTY_F64, _EMPTY_F64
+        return out_prices[:i], out_qtys[:i]
+    try:
+        if isinstance(side, dict):
+            n = len(side)
+            prices = np.fromiter(map(float, side.keys()), dtype=np.float64, count=n)
+            qtys = np.fromiter(map(float, side.values()), dtype=np.float64, count=n)
+        elif isinstance(side, list):
+            n = len(side)
+            prices = np.fromiter((float(e[0]) for e in side), dtype=np.float64, count=n)
+            qtys = np.fromiter((float(e[1]) for e in side), dtype=np.float64, count=n)
+        else:
+            return _EMPTY_F64, _EMPTY_F64
+    except (TypeError, ValueError, IndexError, KeyError):
+        return _EMPTY_F64, _EMPTY_F64
+    return prices, qtys
+
+def _pick_candidate_py(prices: np.ndarray, qtys: np.ndarray, limit_price: float,
+                       min_volume: float, is_buy: bool) -> float:
+    """First price level with enough volume on the right side of limit_price,
+    or -1.0 if none qualifies (prices are always positive)."""
+    for i in range(prices.shape[0]):
+        p = prices[i]
+        if p * qtys[i] > min_volume:
+            if (p < limit_price) if is_buy else (p > limit_price):
+                return p
+    return -1.0
+
+def _pick_candidate_np(prices: np.ndarray, qtys: np.ndarray, limit_price: float,
+                       min_volume: float, is_buy: bool) -> float:
+    """Branchless NumPy variant of the scan: the volume/limit conditions are
+    evaluated in one vectorized pass and np.argmax on the bool mask yields the
+    first qualifying index, instead of an interpreted per-level loop."""
+    side_ok = prices < limit_price if is_buy else prices > limit_price
+    cond = (prices * qtys > min_volume) & side_ok
+    if cond.any():
+        return float(prices[np.argmax(cond)])
+    return -1.0
+
+# Numba compiles the early-exit loop to native code (cache=True avoids re-JIT
+# on every startup); without numba the vectorized NumPy scan is used instead.
+try:
+    import numba
+    pick_candidate = numba.njit(cache=True)(_pick_candidate_py)
+except ImportError:
+    pick_candidate = _pick_candidate_np
+
+# Shared orderbook snapshots: one background refresher task per coin keeps the
+# snapshot warm at a single cadence, so HTTP traffic to the public endpoint is
+# O(distinct coins) rather than O(sessions). Refreshers are refcounted by the
+# sessions using them and stop when the last one ends. All of this state is
+# only touched from the session loop, so no locking is needed.
+ORDERBOOK_REFRESH_INTERVAL = 1.0
+_ORDERBOOK_MAX_AGE = 5.0
+_orderbook_cache: Dict[str, tuple] = {}
+_coin_refreshers: Dict[str, asyncio.Task] = {}
+_coin_refcounts: Dict[str, int] = defaultdict(int)
+
+_OB_TIMEOUT = aiohttp.ClientTimeout(total=8.0)
+
+async def _refresh_orderbook(coin: str):
+    # URL and timeout are built once per refresher, not per fetch.
+    url = PUBLIC_ORDERBOOK.format(coin=coin.upper())
+    sess = await _get_aio_session()
+    while _coin_refcounts[coin] > 0:
+        try:
+            async with sess.get(url, timeout=_OB_TIMEOUT) as r:
+                r.raise_for_status()
+                _orderbook_cache[coin] = (time.monotonic(), _json_loads(await r.read()))
+        except Exception as e:
+            logger.warning("Orderbook fetch failed for %s: %s", coin, e)
+        await asyncio.sleep(ORDERBOOK_REFRESH_INTERVAL)
+    _coin_refreshers.pop(coin, None)
+
+def acquire_orderbook_feed(coin: str):
+    _coin_refcounts[coin] += 1
+    task = _coin_refreshers.get(coin)
+    if task is None or task.done():
+        _coin_refreshers[coin] = asyncio.get_running_loop().create_task(_refresh_orderbook(coin))
+
+def release_orderbook_feed(coin: str):
+    _coin_refcounts[coin] -= 1
+
+def orderbook_snapshot(coin: str) -> Optional[dict]:
+    snap = _orderbook_cache.get(coin)
+    if snap and time.monotonic() - snap[0] < _ORDERBOOK_MAX_AGE:
+        return snap[1]
+    return None
+
+async def _sleep_or_stop(session_obj: dict, delay: float) -> bool:
+    """Pause the session for up to ``delay`` seconds, waking immediately if its
+    stop event fires. Returns True when the session should shut down."""
+    try:
+        await asyncio.wait_for(session_obj["stop_event"].wait(), timeout=delay)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+_NOTIFY_TMPL = "✅ Session %s: order updated to price %s (%s) for %s"
+
+# Background worker (one asyncio task per continuous session)
+async def run_session(user_id: int, session_id: int, session_obj: dict):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Starting session %s for user %s", session_id, user_id)
     backoff = 1.0
     bot = session_obj["bot"]
     chat_id = session_obj["chat_id"]
+    mode_label = session_obj["mode"].upper()
+    # Sub-views capping the SoA buffers at the top of the book.
+    bids_p_buf = session_obj["bids_p"][:TOP_LEVELS]
+    bids_q_buf = session_obj["bids_q"][:TOP_LEVELS]
+    asks_p_buf = session_obj["asks_p"][:TOP_LEVELS]
+    asks_q_buf = session_obj["asks_q"][:TOP_LEVELS]
+    acquire_orderbook_feed(session_obj["coin"])
     while not session_obj["stop_event"].is_set():
         try:
             coin = session_obj["coin"]
@@ -135,189 +366,162 @@ def start_continuous_edit(user_id: int, session_id: int, session_obj: dict):
             tick = session_obj["tick_size"]
             mode = session_obj["mode"]
             min_volume = session_obj.get("min_volume", 50.0)
-            ob = get_public_orderbook(coin)
+            ob = orderbook_snapshot(coin)
             if ob is None:
                 backoff = min(backoff * 1.5, 30.0)
-                time.sleep(session_obj["loop_delay"] + backoff)
+                if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                    break
                 continue
-            bids = ob.get("bids", [])
-            asks = ob.get("asks", [])
-            def extract_best(side, pick_max):
-                prices = []
-                if isinstance(side, dict):
-                    for k in side.keys():
-                        try:
-                            prices.append(float(k))
-                        except Exception:
-                            continue
-                elif isinstance(side, list):
-                    for item in side:
-                        try:
-                            prices.append(float(item[0]))
-                        except Exception:
-                            try:
-                                prices.append(float(item))
-                            except Exception:
-                                continue
-                if not prices:
-                    return None
-                return max(prices) if pick_max else min(prices)
-            best_bid = extract_best(bids, True)
-            best_ask = extract_best(asks, False)
+            bid_prices, bid_qtys = side_arrays(ob.get("bids", []), bids_p_buf, bids_q_buf)
+            ask_prices, ask_qtys = side_arrays(ob.get("asks", []), asks_p_buf, asks_q_buf)
+            best_bid = float(bid_prices.max()) if bid_prices.size else None
+            best_ask = float(ask_prices.min()) if ask_prices.size else None
 
+            limit_price = session_obj["limit_price"]
             if mode == "buy":
-                candidate = None
-                items = bids.items() if isinstance(bids, dict) else bids
-                for entry in items:
-                    try:
-                        if isinstance(entry, tuple):
-                            p_str, q = entry
-                        else:
-                            p_str, q = entry[0], entry[1]
-                        p = float(p_str); q = float(q)
-                    except Exception:
-                        continue
-                    if p * q <= min_volume:
-                        continue
-                    if p < session_obj["limit_price"]:
-                        candidate = p; break
-                if candidate is None and best_bid and best_bid < session_obj["limit_price"]:
-                    candidate = best_bid
+                candidate = float(pick_candidate(bid_prices, bid_qtys, limit_price, min_volume, True))
+                if candidate < 0.0:
+                    candidate = best_bid if best_bid and best_bid < limit_price else None
                 if candidate is None:
                     backoff = min(backoff * 1.5, 30.0)
-                    time.sleep(session_obj["loop_delay"] + backoff)
+                    if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                        break
                     continue
                 new_price = round_price(candidate + tick, precision)
             else:
-                candidate = None
-                items = asks.items() if isinstance(asks, dict) else asks
-                for entry in items:
-                    try:
-                        if isinstance(entry, tuple):
-                            p_str, q = entry
-                        else:
-                            p_str, q = entry[0], entry[1]
-                        p = float(p_str); q = float(q)
-                    except Exception:
-                        continue
-                    if p * q <= min_volume:
-                        continue
-                    if p > session_obj["limit_price"]:
-                        candidate = p; break
-                if candidate is None and best_ask and best_ask > session_obj["limit_price"]:
-                    candidate = best_ask
+                candidate = float(pick_candidate(ask_prices, ask_qtys, limit_price, min_volume, False))
+                if candidate < 0.0:
+                    candidate = best_ask if best_ask and best_ask > limit_price else None
                 if candidate is None:
                     backoff = min(backoff * 1.5, 30.0)
-                    time.sleep(session_obj["loop_delay"] + backoff)
+                    if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                        break
                     continue
                 new_price = round_price(candidate - tick, precision)
 
+            # Adaptive pacing: if the book hasn't moved our target, skip the
+            # edit and back off to 4x the baseline delay.
             order_id = session_obj.get("order_id")
+            if order_id and new_price == session_obj.get("last_posted_price"):
+                if await _sleep_or_stop(session_obj, session_obj["loop_delay"] * 4):
+                    break
+                continue
             if not order_id:
                 if session_obj.get("investment_inr"):
                     qty = session_obj["investment_inr"] / new_price
                 else:
                     qty = float(session_obj.get("quantity", 0.0))
-                create_resp = create_limit_order(session_obj["mode"], session_obj["coin"], new_price, qty)
+                create_resp = await acreate_limit_order(session_obj["mode"], session_obj["coin"], new_price, qty)
                 if create_resp and isinstance(create_resp, dict):
                     oid = create_resp.get("id") or (create_resp.get("orders") and create_resp["orders"][0].get("id"))
                     if oid:
                         session_obj["order_id"] = str(oid)
+                        session_obj["last_posted_price"] = new_price
                         backoff = 1.0
                     else:
                         backoff = min(backoff * 1.5, 30.0)
-                        time.sleep(session_obj["loop_delay"] + backoff)
+                        if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                            break
                         continue
                 else:
                     backoff = min(backoff * 1.5, 30.0)
-                    time.sleep(session_obj["loop_delay"] + backoff)
+                    if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                        break
                     continue
             else:
-                edit_resp = edit_order(session_obj["order_id"], new_price)
+                edit_resp = await aedit_order(session_obj["order_id"], new_price)
                 if not edit_resp:
                     session_obj.pop("order_id", None)
+                    session_obj.pop("last_posted_price", None)
                     backoff = min(backoff * 1.5, 30.0)
-                    time.sleep(session_obj["loop_delay"] + backoff)
+                    if await _sleep_or_stop(session_obj, session_obj["loop_delay"] + backoff):
+                        break
                     continue
+                session_obj["last_posted_price"] = new_price
                 backoff = 1.0
 
             now = time.time()
             if now - session_obj.get("last_notify", 0) > session_obj.get("notify_interval", 15):
                 try:
-                    bot.send_message(chat_id, f"✅ Session {session_id}: order updated to price {new_price} ({mode.upper()}) for {coin}")
+                    msg = _NOTIFY_TMPL % (session_id, new_price, mode_label, coin)
+                    await bot.send_message(chat_id, msg)
                 except Exception:
                     logger.exception("Notify failed for session %s", session_id)
                 session_obj["last_notify"] = now
 
-            time.sleep(session_obj["loop_delay"])
+            if await _sleep_or_stop(session_obj, session_obj["loop_delay"]):
+                break
         except Exception as e:
             logger.exception("Session worker error: %s", e)
-            time.sleep(min(backoff*2, 60.0))
+            if await _sleep_or_stop(session_obj, min(backoff*2, 60.0)):
+                break
 
     # cleanup
+    _release_session_slot()
+    release_orderbook_feed(session_obj["coin"])
     if session_obj.get("order_id") and session_obj.get("cancel_on_stop", True):
         try:
-            cancel_order(session_obj["order_id"])
+            await acancel_order(session_obj["order_id"])
         except Exception:
             pass
-    with session_lock:
-        u = user_sessions.get(user_id, {})
-        u.pop(str(session_id), None)
-    logger.info("Session %s ended", session_id)
+    with _user_lock(user_id):
+        user_sessions[user_id].pop(str(session_id), None)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Session %s ended", session_id)
 
 # Telegram handlers
-def start(update: Update, context: CallbackContext):
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = (
         "🤖 CoinDCX Bot ready.\n"
         "Commands: /buy /sell /profit /status /stop <id> /stopall /help\n"
     )
-    update.message.reply_text(msg)
+    await update.message.reply_text(msg)
 
-def buy_start(update: Update, context: CallbackContext):
-    update.message.reply_text("**Starting Buy Order Setup**\nEnter the coin name (e.g., BTC, ETH):", parse_mode=ParseMode.MARKDOWN)
+async def buy_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("**Starting Buy Order Setup**\nEnter the coin name (e.g., BTC, ETH):", parse_mode=ParseMode.MARKDOWN)
     return BUY_COIN
 
-def buy_coin(update: Update, context: CallbackContext):
+async def buy_coin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     coin = update.message.text.strip().upper()
     context.user_data["buy_coin"] = coin
-    update.message.reply_text(f"✅ Coin: {coin}\nEnter maximum buy price (limit price).")
+    await update.message.reply_text(f"✅ Coin: {coin}\nEnter maximum buy price (limit price).")
     return BUY_PRICE
 
-def buy_price(update: Update, context: CallbackContext):
+async def buy_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         p = float(update.message.text.strip())
         context.user_data["buy_price"] = p
-        update.message.reply_text("Enter investment amount in INR (e.g., 1000):")
+        await update.message.reply_text("Enter investment amount in INR (e.g., 1000):")
         return BUY_INVESTMENT
     except Exception:
-        update.message.reply_text("Invalid price. Enter numeric value.")
+        await update.message.reply_text("Invalid price. Enter numeric value.")
         return BUY_PRICE
 
-def buy_investment(update: Update, context: CallbackContext):
+async def buy_investment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         inv = float(update.message.text.strip())
         context.user_data["buy_investment"] = inv
-        update.message.reply_text("Enter decimal precision (0-10):")
+        await update.message.reply_text("Enter decimal precision (0-10):")
         return BUY_PRECISION
     except Exception:
-        update.message.reply_text("Invalid amount.")
+        await update.message.reply_text("Invalid amount.")
         return BUY_INVESTMENT
 
-def buy_precision(update: Update, context: CallbackContext):
+async def buy_precision(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         prec = int(update.message.text.strip())
         if prec < 0 or prec > 10: raise ValueError
         context.user_data["buy_precision"] = prec
-        update.message.reply_text("Mode? 'once' or 'continuous':")
+        await update.message.reply_text("Mode? 'once' or 'continuous':")
         return BUY_MODE
     except Exception:
-        update.message.reply_text("Invalid precision.")
+        await update.message.reply_text("Invalid precision.")
         return BUY_PRECISION
 
-def buy_mode(update: Update, context: CallbackContext):
+async def buy_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mode = update.message.text.strip().lower()
     if mode not in ("once","continuous"):
-        update.message.reply_text("Type 'once' or 'continuous'")
+        await update.message.reply_text("Type 'once' or 'continuous'")
         return BUY_MODE
     coin = context.user_data["buy_coin"]
     limit_price = float(context.user_data["buy_price"])
@@ -325,85 +529,88 @@ def buy_mode(update: Update, context: CallbackContext):
     precision = int(context.user_data["buy_precision"])
     if mode == "once":
         qty = round(investment / limit_price, precision+6)
-        resp = create_limit_order("buy", coin, round_price(limit_price, precision), qty)
+        resp = await acreate_limit_order("buy", coin, round_price(limit_price, precision), qty)
         if resp:
-            update.message.reply_text(f"✅ One-shot buy placed for {coin} @{limit_price} qty {qty}")
+            await update.message.reply_text(f"✅ One-shot buy placed for {coin} @{limit_price} qty {qty}")
         else:
-            update.message.reply_text("❌ Failed to create buy order.")
+            await update.message.reply_text("❌ Failed to create buy order.")
         return ConversationHandler.END
     else:
+        if not _try_reserve_session_slot():
+            await update.message.reply_text(f"❌ Session limit reached ({MAX_SESSIONS} active). Stop a session and retry.")
+            return ConversationHandler.END
         sid = next_session_id()
-        stop_evt = threading.Event()
+        stop_evt = asyncio.Event()
         session_obj = {
             "mode":"buy","coin":coin,"limit_price":limit_price,"precision":precision,
             "tick_size":1/(10**precision),"investment_inr":investment,"loop_delay":2.0,
             "stop_event":stop_evt,"order_id":None,"chat_id":update.effective_chat.id,"bot":context.bot,
-            "last_notify":0,"notify_interval":15,"min_volume":50.0,"cancel_on_stop":True
+            "last_notify":0,"notify_interval":15,"min_volume":50.0,"cancel_on_stop":True,
+            "bids_p":np.empty(SOA_CAPACITY, dtype=np.float64),"bids_q":np.empty(SOA_CAPACITY, dtype=np.float64),
+            "asks_p":np.empty(SOA_CAPACITY, dtype=np.float64),"asks_q":np.empty(SOA_CAPACITY, dtype=np.float64),
         }
-        thr = threading.Thread(target=start_continuous_edit, args=(update.effective_user.id, sid, session_obj), daemon=True)
-        session_obj["thread"] = thr
-        with session_lock:
-            user_map = user_sessions.setdefault(update.effective_user.id, {})
-            user_map[str(sid)] = session_obj
-        thr.start()
-        update.message.reply_text(f"✅ Started continuous BUY session id {sid} for {coin}")
+        with _user_lock(update.effective_user.id):
+            user_sessions[update.effective_user.id][str(sid)] = session_obj
+        task = context.application.create_task(run_session(update.effective_user.id, sid, session_obj))
+        session_obj["task"] = task
+        await update.message.reply_text(f"✅ Started continuous BUY session id {sid} for {coin}")
         return ConversationHandler.END
 
 # Sell conversation handlers (mirror buy flow)
-def sell_start(update: Update, context: CallbackContext):
-    update.message.reply_text("**Starting Sell Order Setup**\nEnter the coin name (e.g., BTC, ETH):", parse_mode=ParseMode.MARKDOWN)
+async def sell_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("**Starting Sell Order Setup**\nEnter the coin name (e.g., BTC, ETH):", parse_mode=ParseMode.MARKDOWN)
     return SELL_COIN
 
-def sell_coin(update: Update, context: CallbackContext):
+async def sell_coin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     coin = update.message.text.strip().upper()
     context.user_data["sell_coin"] = coin
-    update.message.reply_text(f"✅ Coin: {coin}\nEnter minimum sell price (limit price).")
+    await update.message.reply_text(f"✅ Coin: {coin}\nEnter minimum sell price (limit price).")
     return SELL_PRICE
 
-def sell_price(update: Update, context: CallbackContext):
+async def sell_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         p = float(update.message.text.strip())
         context.user_data["sell_price"] = p
-        update.message.reply_text("Enter quantity to SELL (coin units) or type 'inr:<amount>' to specify INR amount to sell (e.g., inr:1000):")
+        await update.message.reply_text("Enter quantity to SELL (coin units) or type 'inr:<amount>' to specify INR amount to sell (e.g., inr:1000):")
         return SELL_INVESTMENT
     except Exception:
-        update.message.reply_text("Invalid price. Enter numeric value.")
+        await update.message.reply_text("Invalid price. Enter numeric value.")
         return SELL_PRICE
 
-def sell_investment(update: Update, context: CallbackContext):
+async def sell_investment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip().lower()
     if text.startswith("inr:"):
         try:
             inr = float(text.split(":",1)[1])
             context.user_data["sell_inr"] = inr
         except Exception:
-            update.message.reply_text("Invalid INR format. Use inr:1000")
+            await update.message.reply_text("Invalid INR format. Use inr:1000")
             return SELL_INVESTMENT
     else:
         try:
             qty = float(text)
             context.user_data["sell_qty"] = qty
         except Exception:
-            update.message.reply_text("Invalid quantity. Enter number or inr:<amount>")
+            await update.message.reply_text("Invalid quantity. Enter number or inr:<amount>")
             return SELL_INVESTMENT
-    update.message.reply_text("Enter decimal precision (0-10):")
+    await update.message.reply_text("Enter decimal precision (0-10):")
     return SELL_PRECISION
 
-def sell_precision(update: Update, context: CallbackContext):
+async def sell_precision(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         prec = int(update.message.text.strip())
         if prec < 0 or prec > 10: raise ValueError
         context.user_data["sell_precision"] = prec
-        update.message.reply_text("Mode? 'once' or 'continuous':")
+        await update.message.reply_text("Mode? 'once' or 'continuous':")
         return SELL_MODE
     except Exception:
-        update.message.reply_text("Invalid precision.")
+        await update.message.reply_text("Invalid precision.")
         return SELL_PRECISION
 
-def sell_mode(update: Update, context: CallbackContext):
+async def sell_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mode = update.message.text.strip().lower()
     if mode not in ("once","continuous"):
-        update.message.reply_text("Type 'once' or 'continuous'")
+        await update.message.reply_text("Type 'once' or 'continuous'")
         return SELL_MODE
     coin = context.user_data["sell_coin"]
     limit_price = float(context.user_data["sell_price"])
@@ -416,162 +623,153 @@ def sell_mode(update: Update, context: CallbackContext):
         else:
             qty_calc = qty
         if not qty_calc:
-            update.message.reply_text("❌ Could not determine quantity to sell.")
+            await update.message.reply_text("❌ Could not determine quantity to sell.")
         else:
-            resp = create_limit_order("sell", coin, round_price(limit_price, precision), float(qty_calc))
+            resp = await acreate_limit_order("sell", coin, round_price(limit_price, precision), float(qty_calc))
             if resp:
-                update.message.reply_text(f"✅ One-shot sell placed for {coin} @{limit_price} qty {qty_calc}")
+                await update.message.reply_text(f"✅ One-shot sell placed for {coin} @{limit_price} qty {qty_calc}")
             else:
-                update.message.reply_text("❌ Failed to create sell order.")
+                await update.message.reply_text("❌ Failed to create sell order.")
         return ConversationHandler.END
     else:
+        if not _try_reserve_session_slot():
+            await update.message.reply_text(f"❌ Session limit reached ({MAX_SESSIONS} active). Stop a session and retry.")
+            return ConversationHandler.END
         sid = next_session_id()
-        stop_evt = threading.Event()
+        stop_evt = asyncio.Event()
         session_obj = {
             "mode":"sell","coin":coin,"limit_price":limit_price,"precision":precision,
             "tick_size":1/(10**precision),"investment_inr":inr if inr else None,"quantity":qty if qty else None,
             "loop_delay":2.0,"stop_event":stop_evt,"order_id":None,"chat_id":update.effective_chat.id,"bot":context.bot,
-            "last_notify":0,"notify_interval":15,"min_volume":200.0,"cancel_on_stop":True
+            "last_notify":0,"notify_interval":15,"min_volume":200.0,"cancel_on_stop":True,
+            "bids_p":np.empty(SOA_CAPACITY, dtype=np.float64),"bids_q":np.empty(SOA_CAPACITY, dtype=np.float64),
+            "asks_p":np.empty(SOA_CAPACITY, dtype=np.float64),"asks_q":np.empty(SOA_CAPACITY, dtype=np.float64),
         }
-        thr = threading.Thread(target=start_continuous_edit, args=(update.effective_user.id, sid, session_obj), daemon=True)
-        session_obj["thread"] = thr
-        with session_lock:
-            user_map = user_sessions.setdefault(update.effective_user.id, {})
-            user_map[str(sid)] = session_obj
-        thr.start()
-        update.message.reply_text(f"✅ Started continuous SELL session id {sid} for {coin}")
+        with _user_lock(update.effective_user.id):
+            user_sessions[update.effective_user.id][str(sid)] = session_obj
+        task = context.application.create_task(run_session(update.effective_user.id, sid, session_obj))
+        session_obj["task"] = task
+        await update.message.reply_text(f"✅ Started continuous SELL session id {sid} for {coin}")
         return ConversationHandler.END
 
-def profit_start(update: Update, context: CallbackContext):
-    update.message.reply_text("Enter coin for profit calc (e.g., BTC):")
+async def profit_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Enter coin for profit calc (e.g., BTC):")
     return PROFIT_COIN
 
-def profit_coin(update: Update, context: CallbackContext):
+async def profit_coin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     coin = update.message.text.strip().upper()
-    data = get_public_orderbook(coin)
+    data = await aget_public_orderbook(coin)
     if not data:
-        update.message.reply_text("Failed to fetch orderbook.")
+        await update.message.reply_text("Failed to fetch orderbook.")
         return ConversationHandler.END
-    bids = data.get("bids", [])
-    asks = data.get("asks", [])
-    def best_from(side, pick_max):
-        prices = []
-        if isinstance(side, dict):
-            for k in side.keys():
-                try: prices.append(float(k))
-                except: pass
-        elif isinstance(side, list):
-            for item in side:
-                try: prices.append(float(item[0]))
-                except:
-                    try: prices.append(float(item))
-                    except: pass
-        if not prices: return None
-        return max(prices) if pick_max else min(prices)
-    best_bid = best_from(bids, True)
-    best_ask = best_from(asks, False)
+    bid_prices, _ = side_arrays(data.get("bids", []))
+    ask_prices, _ = side_arrays(data.get("asks", []))
+    best_bid = float(bid_prices.max()) if bid_prices.size else None
+    best_ask = float(ask_prices.min()) if ask_prices.size else None
     if not best_bid or not best_ask:
-        update.message.reply_text("Could not determine best bid/ask.")
+        await update.message.reply_text("Could not determine best bid/ask.")
         return ConversationHandler.END
     inv = 1000.0
     qty = inv / best_ask
     sell_revenue = qty * best_bid
     fee = 0.001
     profit = sell_revenue - inv - (inv*fee + sell_revenue*fee)
-    update.message.reply_text(f"Coin: {coin}\nBuy@{best_ask}\nSell@{best_bid}\nProfit(after fees): Rs.{profit:.2f}")
+    await update.message.reply_text(f"Coin: {coin}\nBuy@{best_ask}\nSell@{best_bid}\nProfit(after fees): Rs.{profit:.2f}")
     return ConversationHandler.END
 
-def status(update: Update, context: CallbackContext):
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    with session_lock:
+    with _user_lock(uid):
         s = user_sessions.get(uid, {})
         if not s:
-            update.message.reply_text("No active trading sessions found.")
+            await update.message.reply_text("No active trading sessions found.")
             return
         lines = []
         for sid, o in s.items():
             lines.append(f"ID {sid} | {o['mode'].upper()} {o['coin']} | limit {o['limit_price']} | prec {o['precision']} | order_id {o.get('order_id') or 'N/A'}")
-    update.message.reply_text("\n".join(lines))
+    await update.message.reply_text("\n".join(lines))
 
-def stop(update: Update, context: CallbackContext):
+async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args:
-        update.message.reply_text("Usage: /stop <session_id>")
+        await update.message.reply_text("Usage: /stop <session_id>")
         return
     sid = args[0]
     uid = update.effective_user.id
-    with session_lock:
+    with _user_lock(uid):
         s = user_sessions.get(uid, {})
         session = s.get(sid) if s else None
         if not session:
-            update.message.reply_text("No such active session.")
+            await update.message.reply_text("No such active session.")
             return
         session["stop_event"].set()
-    update.message.reply_text(f"Stopping session {sid}...")
+    await update.message.reply_text(f"Stopping session {sid}...")
 
-def stopall(update: Update, context: CallbackContext):
+async def stopall(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    with session_lock:
+    with _user_lock(uid):
         s = user_sessions.get(uid, {})
         if not s:
-            update.message.reply_text("No active sessions to stop.")
+            await update.message.reply_text("No active sessions to stop.")
             return
         for v in list(s.values()):
             v["stop_event"].set()
-    update.message.reply_text("Stopping all sessions...")
+    await update.message.reply_text("Stopping all sessions...")
+
+async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Unknown command. Use /help")
 
-def unknown(update: Update, context: CallbackContext):
-    update.message.reply_text("Unknown command. Use /help")
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Cancelled.")
+    return ConversationHandler.END
 
 def main():
-    updater = Updater(TELEGRAM_TOKEN, use_context=True)
-    dp = updater.dispatcher
-    dp.add_handler(CommandHandler("start", start))
-    dp.add_handler(CommandHandler("help", start))
-    dp.add_handler(CommandHandler("status", status))
-    dp.add_handler(CommandHandler("stop", stop))
-    dp.add_handler(CommandHandler("stopall", stopall))
+    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", start))
+    application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("stop", stop))
+    application.add_handler(CommandHandler("stopall", stopall))
     # Buy conv
     buy_conv = ConversationHandler(
         entry_points=[CommandHandler("buy", buy_start)],
         states={
-            BUY_COIN: [MessageHandler(Filters.text & ~Filters.command, buy_coin)],
-            BUY_PRICE: [MessageHandler(Filters.text & ~Filters.command, buy_price)],
-            BUY_INVESTMENT: [MessageHandler(Filters.text & ~Filters.command, buy_investment)],
-            BUY_PRECISION: [MessageHandler(Filters.text & ~Filters.command, buy_precision)],
-            BUY_MODE: [MessageHandler(Filters.text & ~Filters.command, buy_mode)],
+            BUY_COIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, buy_coin)],
+            BUY_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, buy_price)],
+            BUY_INVESTMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, buy_investment)],
+            BUY_PRECISION: [MessageHandler(filters.TEXT & ~filters.COMMAND, buy_precision)],
+            BUY_MODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, buy_mode)],
         },
-        fallbacks=[CommandHandler("cancel", lambda u,c: (u.message.reply_text("Cancelled."), ConversationHandler.END)[1])],
+        fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
     )
-    dp.add_handler(buy_conv)
+    application.add_handler(buy_conv)
 
     # Sell conv
     sell_conv = ConversationHandler(
         entry_points=[CommandHandler("sell", sell_start)],
         states={
-            SELL_COIN: [MessageHandler(Filters.text & ~Filters.command, sell_coin)],
-            SELL_PRICE: [MessageHandler(Filters.text & ~Filters.command, sell_price)],
-            SELL_INVESTMENT: [MessageHandler(Filters.text & ~Filters.command, sell_investment)],
-            SELL_PRECISION: [MessageHandler(Filters.text & ~Filters.command, sell_precision)],
-            SELL_MODE: [MessageHandler(Filters.text & ~Filters.command, sell_mode)],
+            SELL_COIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, sell_coin)],
+            SELL_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, sell_price)],
+            SELL_INVESTMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, sell_investment)],
+            SELL_PRECISION: [MessageHandler(filters.TEXT & ~filters.COMMAND, sell_precision)],
+            SELL_MODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, sell_mode)],
         },
-        fallbacks=[CommandHandler("cancel", lambda u,c: (u.message.reply_text("Cancelled."), ConversationHandler.END)[1])],
+        fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
     )
-    dp.add_handler(sell_conv)
+    application.add_handler(sell_conv)
 
     # Profit conv
     profit_conv = ConversationHandler(entry_points=[CommandHandler("profit", profit_start)],
-        states={PROFIT_COIN: [MessageHandler(Filters.text & ~Filters.command, profit_coin)]},
-        fallbacks=[CommandHandler("cancel", lambda u,c: (u.message.reply_text("Cancelled."), ConversationHandler.END)[1])])
-    dp.add_handler(profit_conv)
+        states={PROFIT_COIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, profit_coin)]},
+        fallbacks=[CommandHandler("cancel", cancel)])
+    application.add_handler(profit_conv)
 
-    dp.add_handler(MessageHandler(Filters.command, unknown))
+    application.add_handler(MessageHandler(filters.COMMAND, unknown))
 
-    updater.start_polling()
     logger.info("Bot started.")
-    updater.idle()
+    application.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,3 @@
-import io
-import struct
-
 def what(file, h=None):
     if h is None:
         if isinstance(file, (str, bytes)):
@@ -12,22 +9,13 @@ def what(file, h=None):
             file.seek(pos)
         else:
             return None
-    for typ, test in tests:
-        res = test(h)
-        if res:
-            return res
-    return None
-
-def test_jpeg(h):
-    if h[6:10] in (b'JFIF', b'Exif'):
+    # Single branchy compare chain instead of a dispatch-table loop; the
+    # memoryview keeps the slice compares from copying bytes.
+    v = memoryview(h)
+    if v[6:10] in (b'JFIF', b'Exif'):
         return 'jpeg'
-
-def test_png(h):
-    if h[:8] == b'\211PNG\r\n\032\n':
+    if v[:8] == b'\211PNG\r\n\032\n':
         return 'png'
-
-def test_gif(h):
-    if h[:6] in (b'GIF87a', b'GIF89a'):
+    if v[:6] in (b'GIF87a', b'GIF89a'):
         return 'gif'
-
-tests = [("jpeg", test_jpeg), ("png", test_png), ("gif", test_gif)]
+    return None